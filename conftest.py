@@ -0,0 +1,59 @@
+"""
+Session-scoped pytest fixtures for the MCP stdio testers.
+
+Each server is started and initialized once per pytest session and shared by
+all tests that use it; tests are skipped when the server is not available.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from test_server import MCPServerTester, find_server_path
+from test_shell_server import DEFAULT_ALLOW_COMMANDS, MCPShellServerTester
+
+
+@pytest.fixture(scope="session")
+def mcp_server():
+    """Initialized MCPServerTester for the Obsidian notes server."""
+    server_path = find_server_path()
+    if not os.path.exists(server_path):
+        pytest.skip(f"Server binary not found at {server_path} (run cargo build)")
+
+    vault_location = os.environ.get("VAULT_LOCATION")
+    if not vault_location:
+        pytest.skip("VAULT_LOCATION environment variable must be set")
+
+    tester = MCPServerTester(server_path, vault_location)
+    tester.connect()
+    yield tester
+    tester.stop_server()
+
+
+@pytest.fixture(scope="session")
+def mcp_tools(mcp_server):
+    """Tool list from the Obsidian notes server (tools/list runs once)."""
+    return mcp_server.test_list_tools()
+
+
+@pytest.fixture(scope="session")
+def shell_server():
+    """Initialized MCPShellServerTester for uvx mcp-shell-server."""
+    if shutil.which("uvx") is None:
+        pytest.skip("uvx not found on PATH")
+
+    tester = MCPShellServerTester(
+        command="uvx",
+        args=["mcp-shell-server"],
+        allow_commands=os.environ.get("ALLOW_COMMANDS", DEFAULT_ALLOW_COMMANDS),
+    )
+    tester.connect()
+    yield tester
+    tester.stop_server()
+
+
+@pytest.fixture(scope="session")
+def shell_tools(shell_server):
+    """Tool list from the shell server (tools/list runs once)."""
+    return shell_server.test_list_tools()
@@ -0,0 +1,414 @@
+"""
+Shared stdio JSON-RPC client for the MCP server test scripts.
+
+MCPStdioTester owns the server process, request/response framing, stderr
+capture and the protocol-level tests (initialize, initialized, tools/list).
+test_server.py and test_shell_server.py subclass it with their own
+start_server() and tool tests.
+
+Set MCP_TEST_VERBOSE=1 to pretty-print every request and response.
+"""
+
+import json
+import os
+import selectors
+import subprocess
+import threading
+import traceback
+from typing import Dict, Any, List, Optional
+
+try:
+    import orjson  # Optional: faster JSON-RPC serialization and parsing
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    parse_json = orjson.loads  # Accepts the raw response bytes, including memoryview frames
+    dump_json = orjson.dumps  # Returns compact UTF-8 bytes, ready to write
+
+    def format_json(obj: Any) -> str:
+        """Pretty-print a message for verbose output."""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+else:
+    def parse_json(data: Any) -> Any:
+        # json.loads does not accept memoryview frames
+        return json.loads(data.tobytes() if isinstance(data, memoryview) else data)
+
+    def dump_json(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def format_json(obj: Any) -> str:
+        return json.dumps(obj, indent=2)
+
+# Pretty-print full request/response bodies (off by default: large tool results are costly to format)
+VERBOSE = os.environ.get("MCP_TEST_VERBOSE") == "1"
+
+# Initial size of the reused stdout read buffer (grows for larger frames)
+READ_BUFFER_SIZE = 64 * 1024
+
+# Protocol versions the servers may negotiate in their initialize result
+SUPPORTED_PROTOCOL_VERSIONS = ("2024-11-05", "2025-03-26", "2025-06-18", "2025-11-25")
+
+# Experimental capability used to negotiate length-prefixed server->client frames.
+# When the server advertises it in its initialize result, each response is sent as a
+# 10-byte ASCII length header plus "\n", followed by exactly that many bytes of JSON.
+LENGTH_PREFIXED_FRAMING = "lengthPrefixedFraming"
+
+# Constant handshake messages, serialized once. "id":0 in the initialize frame is a
+# placeholder that send_cached_request_async() replaces with the actual request id.
+INITIALIZE_FRAME = dump_json({
+    "jsonrpc": "2.0",
+    "id": 0,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-06-18",
+        "capabilities": {"experimental": {LENGTH_PREFIXED_FRAMING: {}}},
+        "clientInfo": {"name": "test-client", "version": "1.0.0"},
+    },
+}) + b"\n"
+INITIALIZED_FRAME = dump_json({"jsonrpc": "2.0", "method": "notifications/initialized"}) + b"\n"
+
+
+class MCPStdioTester:
+    """
+    Base tester for an MCP server spoken to over stdio.
+
+    Subclasses implement start_server() (usually by calling _spawn_server()) and
+    run_tool_tests(), which run_all_tests() calls after the protocol handshake.
+    """
+
+    def __init__(self, response_timeout: float = 1.0, first_response_timeout: Optional[float] = None):
+        self.response_timeout = response_timeout
+        self.first_response_timeout = first_response_timeout or response_timeout
+        self.process: Optional[subprocess.Popen] = None
+        self.selector: Optional[selectors.BaseSelector] = None
+        self.stdout_fd = -1  # Raw stdout pipe fd, read with os.readv()
+        self.stderr_lines: List[str] = []  # Filled by the stderr drain thread
+        self.stderr_thread: Optional[threading.Thread] = None
+        self.stderr_printed = 0  # Number of stderr_lines already shown
+        self.request_id = 1
+        self.length_prefixed = False  # Set once the server advertises LENGTH_PREFIXED_FRAMING
+        # Reused across responses; unparsed bytes are read_buffer[read_start:read_end]
+        self.read_buffer = bytearray(READ_BUFFER_SIZE)
+        self.read_start = 0
+        self.read_end = 0
+        self.responses: Dict[int, Dict[str, Any]] = {}  # Responses that arrived before they were awaited
+
+    def start_server(self):
+        """Start the MCP server process."""
+        raise NotImplementedError
+
+    def run_tool_tests(self, tools: List[Dict[str, Any]]):
+        """Run the server-specific tool tests against the tools/list result."""
+        raise NotImplementedError
+
+    def _spawn_server(self, cmd: List[str], env: Optional[Dict[str, str]]):
+        """Start `cmd` with piped stdio, register its stdout and start draining its stderr."""
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=-1,  # Buffered binary pipes; each message is written and flushed once
+            env=env,
+        )
+        # Register stdout once; each wait is then a single epoll/kqueue call on Linux/BSD
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.process.stdout, selectors.EVENT_READ)
+        self.stdout_fd = self.process.stdout.fileno()
+        self.stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self.stderr_thread.start()
+
+    def _drain_stderr(self):
+        """Collect server stderr on a background thread so it never blocks the request path."""
+        for line in self.process.stderr:
+            self.stderr_lines.append(line.decode("utf-8", errors="ignore").rstrip())
+
+    def print_stderr(self):
+        """Print server stderr captured since the last call; never waits for new output."""
+        if self.stderr_thread and self.process and self.process.poll() is not None:
+            self.stderr_thread.join(timeout=1.0)  # Let the drain reach EOF after the server exited
+        new_lines = self.stderr_lines[self.stderr_printed:]
+        if new_lines:
+            self.stderr_printed += len(new_lines)
+            print("\n--- Server stderr output ---")
+            print("\n".join(new_lines))
+
+    def connect(self):
+        """Start the server and complete the initialize/initialized handshake."""
+        self.start_server()
+        try:
+            init_result = self.test_initialize()
+            self.test_initialized_notification()
+        except Exception:
+            self.stop_server()
+            raise
+        return init_result
+
+    def stop_server(self):
+        """Stop the server process."""
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            print("✓ Stopped server")
+        if self.selector:
+            self.selector.close()
+            self.selector = None
+
+    def send_request(
+        self,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Send a JSON-RPC request and wait for response.
+
+        Note: MCP uses newline-delimited JSON over stdio. Each JSON-RPC message
+        must be a single line terminated by \\n, and we split stdout into one
+        complete message per line. If the server negotiated length-prefixed framing
+        during initialize, responses are read by their length header instead.
+        """
+        return self.recv_response(self.send_request_async(method, params), timeout)
+
+    def send_request_async(self, method: str, params: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Send a JSON-RPC request without waiting for its response.
+
+        Returns the request id to pass to recv_response(). Several requests can be
+        in flight at once; responses are matched back to them by id.
+        """
+        request = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": method,
+        }
+        if params:
+            request["params"] = params
+
+        # Send as single-line JSON (required by MCP stdio protocol), framed in one write
+        return self._send_request_frame(method, dump_json(request) + b"\n")
+
+    def send_cached_request_async(self, method: str, frame: bytes) -> int:
+        """Like send_request_async(), but for a pre-serialized frame with an "id":0 placeholder."""
+        return self._send_request_frame(method, frame.replace(b'"id":0', b'"id":%d' % self.request_id, 1))
+
+    def _send_request_frame(self, method: str, payload: bytes) -> int:
+        """Write one request frame carrying the current request id and return that id."""
+        request_id = self.request_id
+        self.request_id += 1
+
+        print(f"\n→ Sending: {method}")
+        if VERBOSE:
+            print(f"  Request: {format_json(parse_json(payload))}")  # Pretty print for display only
+
+        if not self.process or not self.process.stdin:
+            raise RuntimeError("Server not started")
+
+        self.process.stdin.write(payload)
+        self.process.stdin.flush()
+        return request_id
+
+    def recv_response(self, expected_id: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Wait for the response to request `expected_id`.
+
+        Responses to other in-flight requests read along the way are kept in
+        self.responses until their own recv_response() call collects them.
+        """
+        if timeout is None:
+            timeout = self.response_timeout
+
+        while expected_id not in self.responses:
+            with self._read_frame(timeout) as frame:
+                message = parse_json(frame)
+            if "id" in message:
+                self.responses[message["id"]] = message
+
+        response = self.responses.pop(expected_id)
+        if VERBOSE:
+            print(f"← Response: {format_json(response)}")  # Pretty print for display only
+        else:
+            print(f"← Response: id={response.get('id')}")
+
+        # Check for error response
+        if "error" in response:
+            print(f"⚠ Server returned error: {response['error']}")
+
+        return response
+
+    def _read_frame(self, timeout: float) -> memoryview:
+        """
+        Read one server->client message body from stdout.
+
+        The returned view points into self.read_buffer and is only valid until the
+        next read, so parse it right away and release it.
+        """
+        while True:
+            frame = self._take_frame()
+            if frame is not None:
+                return frame
+
+            # Wait for more output; blocks until stdout is readable or the timeout expires
+            if not self.selector.select(timeout):
+                self.print_stderr()
+                raise RuntimeError(f"No response from server (timeout after {timeout}s)")
+
+            self._reserve_read_space()
+            # One readv(2) straight from the pipe fd into the free tail of the reused buffer:
+            # no BufferedReader layer and no fresh bytes object per read
+            with memoryview(self.read_buffer) as view:
+                count = os.readv(self.stdout_fd, [view[self.read_end:]])
+            if not count:
+                raise RuntimeError("No response from server")
+            self.read_end += count
+
+    def _reserve_read_space(self):
+        """Make room at the end of self.read_buffer for the next read."""
+        if self.read_start == self.read_end:
+            self.read_start = self.read_end = 0
+            if len(self.read_buffer) > READ_BUFFER_SIZE:
+                del self.read_buffer[READ_BUFFER_SIZE:]  # Shrink back after an oversized frame
+        if self.read_end < len(self.read_buffer):
+            return
+        if self.read_start > 0:
+            # Move the partial frame to the front
+            pending = self.read_end - self.read_start
+            self.read_buffer[:pending] = self.read_buffer[self.read_start:self.read_end]
+            self.read_start, self.read_end = 0, pending
+        else:
+            # Frame is larger than the buffer: grow it in place
+            self.read_buffer.extend(bytes(len(self.read_buffer)))
+
+    def _take_frame(self) -> Optional[memoryview]:
+        """Return the next complete frame in self.read_buffer, or None if it is incomplete."""
+        while True:
+            newline = self.read_buffer.find(b"\n", self.read_start, self.read_end)
+            if newline < 0:
+                return None
+            if self.length_prefixed:
+                frame_start = newline + 1
+                frame_end = frame_start + int(self.read_buffer[self.read_start:newline])
+                if frame_end > self.read_end:
+                    return None
+                self.read_start = frame_end
+            else:
+                # Read single-line JSON-RPC response (MCP stdio protocol requirement)
+                frame_start, frame_end = self.read_start, newline
+                self.read_start = newline + 1
+            if frame_end > frame_start:
+                return memoryview(self.read_buffer)[frame_start:frame_end]
+
+    def send_notification(self, method: str, params: Optional[Dict[str, Any]] = None):
+        """Send a JSON-RPC notification (no response expected)."""
+        notification = {"jsonrpc": "2.0", "method": method}
+        if params:
+            notification["params"] = params
+
+        self.send_notification_frame(method, dump_json(notification) + b"\n")
+
+    def send_notification_frame(self, method: str, payload: bytes):
+        """Send a pre-serialized notification frame."""
+        print(f"\n→ Sending notification: {method}")
+        if VERBOSE:
+            print(f"  Notification: {format_json(parse_json(payload))}")
+
+        if not self.process or not self.process.stdin:
+            raise RuntimeError("Server not started")
+
+        # No wait needed: stdio is ordered, so the next request is handled after this one
+        self.process.stdin.write(payload)
+        self.process.stdin.flush()
+
+    def test_initialize(self):
+        """Test initialize request."""
+        print("\n" + "=" * 60)
+        print("TEST 1: Initialize")
+        print("=" * 60)
+
+        request_id = self.send_cached_request_async("initialize", INITIALIZE_FRAME)
+        response = self.recv_response(request_id, self.first_response_timeout)
+
+        assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
+        assert "result" in response, "No result in response"
+        protocol_version = response["result"].get("protocolVersion")
+        assert protocol_version in SUPPORTED_PROTOCOL_VERSIONS, f"Unexpected protocol version: {protocol_version}"
+        assert "capabilities" in response["result"], "No capabilities in result"
+        assert "serverInfo" in response["result"], "No serverInfo in result"
+
+        # Fall back to newline-delimited frames unless the server opted in
+        experimental = response["result"]["capabilities"].get("experimental") or {}
+        self.length_prefixed = LENGTH_PREFIXED_FRAMING in experimental
+        print(f"✓ Framing: {'length-prefixed' if self.length_prefixed else 'newline-delimited'}")
+
+        print("✓ Initialize test passed")
+        return response["result"]
+
+    def test_initialized_notification(self):
+        """Test initialized notification."""
+        print("\n" + "=" * 60)
+        print("TEST 2: Initialized Notification")
+        print("=" * 60)
+
+        self.send_notification_frame("notifications/initialized", INITIALIZED_FRAME)
+        print("✓ Initialized notification sent")
+
+    def test_list_tools(self):
+        """Test tools/list request."""
+        print("\n" + "=" * 60)
+        print("TEST 3: List Tools")
+        print("=" * 60)
+
+        response = self.send_request("tools/list")
+
+        assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
+        assert "result" in response, "No result in response"
+        assert "tools" in response["result"], "No tools in result"
+
+        tools = response["result"]["tools"]
+        print(f"\n✓ Found {len(tools)} tools:")
+        for tool in tools:
+            desc = (tool.get("description") or "")[:60]
+            print(f"  - {tool.get('name')}: {desc}...")
+
+        assert len(tools) > 0, "No tools available"
+        return tools
+
+    def run_all_tests(self):
+        """Run all tests in sequence."""
+        try:
+            self.start_server()
+
+            # No sleeps: receiving the initialize response proves the server is up
+            # (it may wait for a cold start), and stdio ordering serializes the rest.
+            self.test_initialize()
+            self.print_stderr()  # Surface any startup warnings without waiting
+
+            # Send initialized notification (required by rmcp)
+            self.test_initialized_notification()
+
+            tools = self.test_list_tools()
+            self.run_tool_tests(tools)
+
+            print("\n" + "=" * 60)
+            print("✓ ALL TESTS PASSED!")
+            print("=" * 60)
+            return True
+
+        except AssertionError as e:
+            print(f"\n✗ TEST FAILED: {e}")
+            return False
+        except BrokenPipeError as e:
+            print(f"\n✗ Server connection broken: {e}")
+            self.print_stderr()
+            return False
+        except Exception as e:
+            print(f"\n✗ ERROR: {e}")
+            traceback.print_exc()
+            self.print_stderr()
+            return False
+        finally:
+            self.stop_server()
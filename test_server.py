@@ -2,216 +2,95 @@
 """
 Test script for MCP server protocol flow.
 Tests initialize, initialized notification, tools/list, and tool calls.
+
+Set MCP_TEST_VERBOSE=1 to pretty-print every request and response.
+The stdio client itself lives in mcp_test_common.py.
+
+Run directly (python3 test_server.py) or via pytest, which shares one server
+process across all tests (see the session fixtures in conftest.py).
 """
 
-import json
+import itertools
 import os
-import subprocess
 import sys
-import time
-from typing import Dict, Any, Optional
-
-
-class MCPServerTester:
+from typing import Dict, Any, Iterator, List, Optional
+
+from mcp_test_common import VERBOSE, MCPStdioTester, parse_json
+
+try:
+    import ijson  # Optional: stream-parse large tool results instead of building the whole list
+except ImportError:
+    ijson = None
+
+# Tools the server must advertise in tools/list
+EXPECTED_TOOLS = frozenset({
+    "list_notes_directory",
+    "read_notes_file",
+    "delete_notes_item",
+    "create_or_update_note",
+    "get_daily_note",
+    "search_vault",
+    "find_related_notes",
+    "replace_text_in_note",
+    "append_to_section",
+    "update_note_properties",
+    "create_note_from_template",
+    "list_notes_templates",
+})
+
+# tools/call params for the read-only tool tests; independent, so run_tool_tests pipelines them
+LIST_NOTES_TEMPLATES_CALL = {"name": "list_notes_templates", "arguments": {}}
+LIST_NOTES_DIRECTORY_CALL = {"name": "list_notes_directory", "arguments": {"path": ".", "limit": 10}}
+
+
+def iter_result_items(text: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the entries of a list-style tool result.
+    
+    New format wraps arrays in objects (e.g., {"items": [...]}); bare arrays are
+    accepted too. Uses ijson when available so the list is never materialized.
+    """
+    prefix = "items.item" if text.lstrip().startswith("{") else "item"
+    if ijson is not None:
+        return ijson.items(text.encode(), prefix, use_float=True)
+    response_data = parse_json(text)
+    items = response_data.get("items", []) if isinstance(response_data, dict) else response_data
+    return iter(items)
+
+
+class MCPServerTester(MCPStdioTester):
     def __init__(self, server_path: str, vault_location: str):
+        super().__init__(response_timeout=1.0)
         self.server_path = server_path
         self.vault_location = vault_location
-        self.process: Optional[subprocess.Popen] = None
-        self.request_id = 1
 
     def start_server(self):
         """Start the MCP server process."""
-        env = os.environ.copy()
-        env["VAULT_LOCATION"] = self.vault_location
+        # Inherit the parent environment as-is (env=None) when it already points at this vault
+        env = None
+        if os.environ.get("VAULT_LOCATION") != self.vault_location:
+            env = {**os.environ, "VAULT_LOCATION": self.vault_location}
         
-        self.process = subprocess.Popen(
-            [self.server_path],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0,  # Unbuffered for better real-time communication
-            env=env
-        )
+        self._spawn_server([self.server_path], env)
         print(f"✓ Started server: {self.server_path}")
         print(f"✓ Using vault: {self.vault_location}")
 
-    def stop_server(self):
-        """Stop the server process."""
-        if self.process:
-            self.process.terminate()
-            try:
-                self.process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-            print("✓ Stopped server")
-
-    def send_request(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
-        """
-        Send a JSON-RPC request and wait for response.
-        
-        Note: MCP uses newline-delimited JSON over stdio. Each JSON-RPC message
-        must be a single line terminated by \\n. The rmcp library handles this
-        automatically, and we use readline() to read one complete message per line.
-        """
-        request = {
-            "jsonrpc": "2.0",
-            "id": self.request_id,
-            "method": method,
-        }
-        if params:
-            request["params"] = params
-        
-        self.request_id += 1
-        
-        # Send as single-line JSON (required by MCP stdio protocol)
-        request_json = json.dumps(request) + "\n"
-        print(f"\n→ Sending: {method}")
-        print(f"  Request: {json.dumps(request, indent=2)}")  # Pretty print for display only
-        
-        if not self.process or not self.process.stdin:
-            raise RuntimeError("Server not started")
-        
-        self.process.stdin.write(request_json)
-        self.process.stdin.flush()
-        
-        # Read response - wait a bit for server to process
-        time.sleep(0.2)
-        
-        # Try to read from stdout with timeout
-        import select
-        import sys
-        
-        # Check if there's data available (non-blocking check)
-        if hasattr(self.process.stdout, 'fileno'):
-            import select
-            ready, _, _ = select.select([self.process.stdout], [], [], 1.0)
-            if not ready:
-                # Check stderr for errors
-                if self.process.stderr:
-                    ready_err, _, _ = select.select([self.process.stderr], [], [], 0.1)
-                    if ready_err:
-                        stderr_line = self.process.stderr.readline()
-                        if stderr_line:
-                            print(f"  Server stderr: {stderr_line.strip()}")
-                raise RuntimeError("No response from server (timeout)")
-        
-        # Read single-line JSON-RPC response (MCP stdio protocol requirement)
-        response_line = self.process.stdout.readline()
-        if not response_line:
-            raise RuntimeError("No response from server")
-        
-        # Parse the single-line JSON response
-        response = json.loads(response_line.strip())
-        print(f"← Response: {json.dumps(response, indent=2)}")  # Pretty print for display only
-        
-        # Check for error response
-        if "error" in response:
-            print(f"⚠ Server returned error: {response['error']}")
-        
-        return response
-
-    def send_notification(self, method: str, params: Dict[str, Any] = None):
-        """Send a JSON-RPC notification (no response expected)."""
-        notification = {
-            "jsonrpc": "2.0",
-            "method": method,
-        }
-        if params:
-            notification["params"] = params
-        
-        notification_json = json.dumps(notification) + "\n"
-        print(f"\n→ Sending notification: {method}")
-        print(f"  Notification: {json.dumps(notification, indent=2)}")
-        
-        if not self.process or not self.process.stdin:
-            raise RuntimeError("Server not started")
-        
-        self.process.stdin.write(notification_json)
-        self.process.stdin.flush()
-        time.sleep(0.1)  # Give server time to process
-
-    def test_initialize(self):
-        """Test initialize request."""
-        print("\n" + "="*60)
-        print("TEST 1: Initialize")
-        print("="*60)
-        
-        response = self.send_request("initialize", {
-            "protocolVersion": "2025-06-18",
-            "capabilities": {},
-            "clientInfo": {
-                "name": "test-client",
-                "version": "1.0.0"
-            }
-        })
-        
-        assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
-        assert "result" in response, "No result in response"
-        # Accept protocol versions that rmcp may negotiate
-        protocol_version = response["result"].get("protocolVersion")
-        assert protocol_version in ["2024-11-05", "2025-03-26", "2025-06-18", "2025-11-25"], f"Unexpected protocol version: {protocol_version}"
-        assert "capabilities" in response["result"], "No capabilities in result"
-        assert "serverInfo" in response["result"], "No serverInfo in result"
-        
-        print("✓ Initialize test passed")
-        return response["result"]
-
-    def test_initialized_notification(self):
-        """Test initialized notification."""
-        print("\n" + "="*60)
-        print("TEST 2: Initialized Notification")
-        print("="*60)
-        
-        self.send_notification("notifications/initialized")
-        time.sleep(0.2)  # Give server time to process notification
-        print("✓ Initialized notification sent")
-
     def test_list_tools(self):
-        """Test tools/list request."""
-        print("\n" + "="*60)
-        print("TEST 3: List Tools")
-        print("="*60)
-        
-        response = self.send_request("tools/list")
-        
-        assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
-        assert "result" in response, "No result in response"
-        assert "tools" in response["result"], "No tools in result"
-        
-        tools = response["result"]["tools"]
-        print(f"\n✓ Found {len(tools)} tools:")
-        for tool in tools:
-            print(f"  - {tool.get('name')}: {tool.get('description', '')[:60]}...")
-        
-        assert len(tools) > 0, "No tools available"
+        """Test tools/list request and check that every expected tool is advertised."""
+        tools = super().test_list_tools()
         
         # Verify expected tools
-        tool_names = [tool["name"] for tool in tools]
-        expected_tools = [
-            "list_notes_directory",
-            "read_notes_file",
-            "delete_notes_item",
-            "create_or_update_note",
-            "get_daily_note",
-            "search_vault",
-            "find_related_notes",
-            "replace_text_in_note",
-            "append_to_section",
-            "update_note_properties",
-            "create_note_from_template",
-            "list_notes_templates"
-        ]
+        tool_names = {tool["name"] for tool in tools}
         
-        print(f"\nFound tools: {', '.join(tool_names)}")
-        for expected in expected_tools:
-            assert expected in tool_names, f"Missing tool: {expected}"
+        print(f"\nFound tools: {', '.join(tool['name'] for tool in tools)}")
+        missing = EXPECTED_TOOLS - tool_names
+        assert not missing, f"Missing tools: {', '.join(sorted(missing))}"
         
         print("✓ All expected tools found")
         return tools
 
-    def test_list_notes_templates(self, tools):
-        """Test list_notes_templates tool."""
+    def test_list_notes_templates(self, tools, response: Optional[Dict[str, Any]] = None):
+        """Test list_notes_templates tool (sends the call unless a pipelined response is given)."""
         print("\n" + "="*60)
         print("TEST 4: List Notes Templates")
         print("="*60)
@@ -219,10 +98,8 @@ class MCPServerTester:
         tool = next((t for t in tools if t["name"] == "list_notes_templates"), None)
         assert tool is not None, "list_notes_templates tool not found"
         
-        response = self.send_request("tools/call", {
-            "name": "list_notes_templates",
-            "arguments": {}
-        })
+        if response is None:
+            response = self.send_request("tools/call", LIST_NOTES_TEMPLATES_CALL)
         
         assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
         assert "result" in response, "No result in response"
@@ -232,20 +109,19 @@ class MCPServerTester:
         assert len(content) > 0, "No content items"
         assert content[0].get("type") == "text", "Invalid content type"
         
-        # Parse the JSON response
-        import json
-        response_data = json.loads(content[0].get("text", "{}"))
-        # New format wraps arrays in objects (e.g., {"items": [...]})
-        templates = response_data.get("items", []) if isinstance(response_data, dict) else response_data
-        print(f"\n✓ Found {len(templates)} templates:")
-        for template in templates[:5]:  # Show first 5
-            print(f"  - {template.get('name')} ({template.get('path')})")
+        text = content[0].get("text", "")
+        assert len(text) > 0, "Empty tool result"
+        if VERBOSE:
+            # Stream just the entries shown; the rest of the payload is never parsed
+            print("\nTemplates (first 5):")
+            for template in itertools.islice(iter_result_items(text), 5):
+                print(f"  - {template.get('name')} ({template.get('path')})")
         
         print("✓ List notes templates test passed")
         return response["result"]
 
-    def test_list_notes_directory(self, tools):
-        """Test list_notes_directory tool."""
+    def test_list_notes_directory(self, tools, response: Optional[Dict[str, Any]] = None):
+        """Test list_notes_directory tool (sends the call unless a pipelined response is given)."""
         print("\n" + "="*60)
         print("TEST 5: List Notes Directory")
         print("="*60)
@@ -253,13 +129,8 @@ class MCPServerTester:
         tool = next((t for t in tools if t["name"] == "list_notes_directory"), None)
         assert tool is not None, "list_notes_directory tool not found"
         
-        response = self.send_request("tools/call", {
-            "name": "list_notes_directory",
-            "arguments": {
-                "path": ".",
-                "limit": 10
-            }
-        })
+        if response is None:
+            response = self.send_request("tools/call", LIST_NOTES_DIRECTORY_CALL)
         
         assert response.get("jsonrpc") == "2.0", "Invalid JSON-RPC version"
         assert "result" in response, "No result in response"
@@ -269,86 +140,30 @@ class MCPServerTester:
         assert len(content) > 0, "No content items"
         assert content[0].get("type") == "text", "Invalid content type"
         
-        # Parse the JSON response
-        import json
-        response_data = json.loads(content[0].get("text", "{}"))
-        # New format wraps arrays in objects (e.g., {"items": [...]})
-        items = response_data.get("items", []) if isinstance(response_data, dict) else response_data
-        print(f"\n✓ Found {len(items)} items in directory:")
-        for item in items[:10]:  # Show first 10
-            item_type = "file" if item.get("is_file") else "directory"
-            size_str = f" ({item.get('size', 0)} bytes)" if item.get("is_file") else ""
-            print(f"  - {item.get('name')} ({item_type}){size_str}")
+        text = content[0].get("text", "")
+        assert len(text) > 0, "Empty tool result"
+        if VERBOSE:
+            # Stream just the entries shown; the rest of the payload is never parsed
+            print("\nDirectory items (first 10):")
+            for item in itertools.islice(iter_result_items(text), 10):
+                item_type = "file" if item.get("is_file") else "directory"
+                size_str = f" ({item.get('size', 0)} bytes)" if item.get("is_file") else ""
+                print(f"  - {item.get('name')} ({item_type}){size_str}")
         
         print("✓ List notes directory test passed")
         return response["result"]
 
-    def run_all_tests(self):
-        """Run all tests in sequence."""
-        try:
-            self.start_server()
-            time.sleep(0.5)  # Give server time to start
-            
-            # Test protocol flow
-            init_result = self.test_initialize()
-            time.sleep(0.1)
-            
-            # Check if server is still alive
-            if self.process.poll() is not None:
-                print(f"\n✗ Server terminated after initialize (exit code: {self.process.returncode})")
-                return False
-            
-            # Send initialized notification (required by rmcp)
-            self.test_initialized_notification()
-            time.sleep(0.2)  # Give server time to process
-            
-            # Check if server is still alive
-            if self.process.poll() is not None:
-                print(f"\n✗ Server terminated after initialized notification (exit code: {self.process.returncode})")
-                if self.process.stderr:
-                    try:
-                        stderr_output = self.process.stderr.read()
-                        if stderr_output:
-                            print("\n--- Server stderr output ---")
-                            print(stderr_output.decode('utf-8', errors='ignore'))
-                    except:
-                        pass
-                return False
-            
-            tools = self.test_list_tools()
-            self.test_list_notes_templates(tools)
-            self.test_list_notes_directory(tools)
-            
-            print("\n" + "="*60)
-            print("✓ ALL TESTS PASSED!")
-            print("="*60)
-            return True
-            
-        except AssertionError as e:
-            print(f"\n✗ TEST FAILED: {e}")
-            return False
-        except BrokenPipeError as e:
-            print(f"\n✗ Server connection broken: {e}")
-            if self.process and self.process.stderr:
-                try:
-                    stderr_output = self.process.stderr.read()
-                    if stderr_output:
-                        print("\n--- Server stderr output ---")
-                        print(stderr_output.decode('utf-8', errors='ignore'))
-                except:
-                    pass
-            return False
-        except Exception as e:
-            print(f"\n✗ ERROR: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
-        finally:
-            self.stop_server()
+    def run_tool_tests(self, tools: List[Dict[str, Any]]):
+        """Run the list_notes tool tests."""
+        # Pipeline the independent tool calls: both are in flight before either is awaited
+        templates_id = self.send_request_async("tools/call", LIST_NOTES_TEMPLATES_CALL)
+        directory_id = self.send_request_async("tools/call", LIST_NOTES_DIRECTORY_CALL)
+        self.test_list_notes_templates(tools, self.recv_response(templates_id))
+        self.test_list_notes_directory(tools, self.recv_response(directory_id))
 
 
-def main():
-    # Determine server path
+def find_server_path() -> str:
+    """Return the server binary path, preferring the release build over the debug build."""
     script_dir = os.path.dirname(os.path.abspath(__file__))
     server_path = os.path.join(script_dir, "target", "debug", "mcp_obsidian_notes")
     
@@ -356,6 +171,26 @@ def main():
     release_path = os.path.join(script_dir, "target", "release", "mcp_obsidian_notes")
     if os.path.exists(release_path):
         server_path = release_path
+    return server_path
+
+
+# pytest entry points: mcp_server/mcp_tools are session fixtures from conftest.py,
+# so the server is started and initialized once for all of these tests.
+
+def test_tools_list(mcp_tools):
+    assert mcp_tools, "No tools available"
+
+
+def test_notes_templates(mcp_server, mcp_tools):
+    mcp_server.test_list_notes_templates(mcp_tools)
+
+
+def test_notes_directory(mcp_server, mcp_tools):
+    mcp_server.test_list_notes_directory(mcp_tools)
+
+
+def main():
+    server_path = find_server_path()
     
     if not os.path.exists(server_path):
         print(f"Error: Server binary not found at {server_path}")